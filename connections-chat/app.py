@@ -26,11 +26,22 @@ SETUP INSTRUCTIONS:
 # Imports
 # =======================
 from dotenv import load_dotenv  # Loads environment variables from .env file
-from openai import OpenAI  # OpenAI API client for GPT models
-import json  # For parsing JSON data (tool arguments come as JSON strings)
+from openai import AsyncOpenAI  # Async OpenAI API client for GPT models
+from openai.types.chat import ChatCompletionMessageToolCall  # Rebuilds tool calls from a stream
+from openai.types.chat.chat_completion_message_tool_call import Function
+import asyncio  # For running tool calls concurrently
+import orjson  # For parsing JSON data (tool arguments come as JSON strings) - faster than json
 import os  # For accessing environment variables
-import requests  # For making HTTP requests to Pushover API
+import re  # For splitting the LinkedIn text into sections
+import glob  # For finding old LinkedIn cache files
+import multiprocessing  # For checking which process start methods are available
+import threading  # For checking whether it is still safe to fork
+from concurrent.futures import ProcessPoolExecutor  # For parsing PDF pages on several CPU cores
+from functools import lru_cache, partial  # For loading the profile once / mapping over PDF pages
+import httpx  # For making async HTTP requests (OpenAI and Pushover)
+import tiktoken  # For counting tokens in the conversation
 from pypdf import PdfReader  # For reading PDF files (LinkedIn profile)
+from pydantic import BaseModel, ConfigDict  # For validating tool arguments
 import gradio as gr  # For creating the web interface
 
 # =======================
@@ -42,7 +53,17 @@ load_dotenv(override=True)
 
 # Create OpenAI client instance
 # This will use OPENAI_API_KEY from your .env file automatically
-openai = OpenAI()
+# We use the async client so a slow completion doesn't tie up one of Gradio's
+# worker threads - the chat function awaits it on the event loop instead
+# The HTTP/2 connection pool lets many concurrent chats share a few TLS
+# connections instead of opening a new socket for each request
+openai = AsyncOpenAI(
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=60
+    )
+)
 
 # =======================
 # Pushover Configuration
@@ -54,6 +75,12 @@ pushover_user = os.getenv("PUSHOVER_USER")  # Your Pushover user key (starts wit
 pushover_token = os.getenv("PUSHOVER_TOKEN")  # Your Pushover app token (starts with a_)
 pushover_url = "https://api.pushover.net/1/messages.json"  # Pushover API endpoint
 
+# One shared async HTTP client for all Pushover calls
+# Creating it once lets every push reuse the same keep-alive connection,
+# so only the first notification pays for the TCP + TLS handshake
+# http2=True needs the h2 package (pip install "httpx[http2]")
+http_client = httpx.AsyncClient(http2=True, timeout=10)
+
 # Check if Pushover credentials are configured
 if pushover_user:
     print(f"Pushover user found and starts with {pushover_user[0]}")
@@ -68,9 +95,10 @@ else:
 # =======================
 # Push Notification Function
 # =======================
-def push(message):
+async def push(message):
     """
     Send a push notification to your phone via Pushover.
+    This is a coroutine so several pushes can be in flight at once.
     
     Args:
         message (str): The message to send as a push notification
@@ -94,7 +122,7 @@ def push(message):
     # Send POST request to Pushover API
     # This will send a push notification to your phone
     try:
-        response = requests.post(pushover_url, data=payload, timeout=10)
+        response = await http_client.post(pushover_url, data=payload)
         response.raise_for_status()  # Raise an error if the request failed
         
         # Check if the push was successful
@@ -103,13 +131,32 @@ def push(message):
             print(f"✓ Push notification sent successfully")
         else:
             print(f"✗ Push notification failed: {result.get('errors', 'Unknown error')}")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"✗ Error sending push notification: {e}")
     except Exception as e:
         print(f"✗ Unexpected error: {e}")
 
+# Push notifications that are still being sent
+# asyncio only keeps a weak reference to running tasks, so we hold on to them
+# here until they finish - otherwise they could be garbage collected mid-send
+pending_pushes = set()
+
+def push_in_background(message):
+    """
+    Start sending a push notification without waiting for it to finish.
+    
+    The tools don't need Pushover's reply to answer the AI, so this keeps the
+    HTTP request off the chat's critical path.
+    
+    Args:
+        message (str): The message to send as a push notification
+    """
+    task = asyncio.create_task(push(message))
+    pending_pushes.add(task)
+    task.add_done_callback(pending_pushes.discard)
+
 # Test the push function (uncomment to test)
-# push("HEY!!")
+# asyncio.run(push("HEY!!"))
 
 # =======================
 # Tool Functions
@@ -117,7 +164,11 @@ def push(message):
 # These are the actual functions that the AI can call (tools)
 # The AI will decide when to call these based on the conversation
 
-def record_user_details(email, name="Name not provided", notes="not provided"):
+# Both tools always reply with the same confirmation, so it is stored already
+# as the JSON string the AI receives - no need to serialize it on every call
+recorded_ok = '{"recorded":"ok"}'
+
+async def record_user_details(email, name="Name not provided", notes="not provided"):
     """
     Record that a user is interested in being contacted.
     This function is called by the AI when a user provides their email.
@@ -128,15 +179,16 @@ def record_user_details(email, name="Name not provided", notes="not provided"):
         notes (str): Additional context about the conversation (optional)
     
     Returns:
-        dict: Confirmation that the details were recorded
+        str: JSON confirmation that the details were recorded
     """
     # Send a push notification with the user's information
-    push(f"Recording interest from {name} with email {email} and notes {notes}")
+    # This runs in the background so the AI gets its answer straight away
+    push_in_background(f"Recording interest from {name} with email {email} and notes {notes}")
     
     # Return a confirmation (the AI will see this response)
-    return {"recorded": "ok"}
+    return recorded_ok
 
-def record_unknown_question(question):
+async def record_unknown_question(question):
     """
     Record a question that the AI couldn't answer.
     This helps you identify gaps in knowledge or areas to improve.
@@ -145,12 +197,13 @@ def record_unknown_question(question):
         question (str): The question that couldn't be answered
     
     Returns:
-        dict: Confirmation that the question was recorded
+        str: JSON confirmation that the question was recorded
     """
     # Send a push notification about the unanswered question
-    push(f"Recording {question} asked that I couldn't answer")
+    # This runs in the background so the AI gets its answer straight away
+    push_in_background(f"Recording {question} asked that I couldn't answer")
     
-    return {"recorded": "ok"}
+    return recorded_ok
 
 # =======================
 # Tool Definitions (JSON Schemas)
@@ -210,58 +263,114 @@ tools = [
     {"type": "function", "function": record_unknown_question_json}
 ]
 
+# =======================
+# Tool Registry
+# =======================
+# The AI chooses which tool to call by name, so we need to map names to functions
+# Only the functions listed here can ever be called - the AI can't reach anything else in this module
+# Each tool also has a Pydantic model that mirrors its JSON schema, so bad arguments are rejected
+# before the function runs
+
+class RecordUserDetailsArgs(BaseModel):
+    model_config = ConfigDict(extra="forbid")  # Same as "additionalProperties": False
+    email: str
+    name: str = "Name not provided"
+    notes: str = "not provided"
+
+class RecordUnknownQuestionArgs(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    question: str
+
+tool_registry = {
+    "record_user_details": (record_user_details, RecordUserDetailsArgs),
+    "record_unknown_question": (record_unknown_question, RecordUnknownQuestionArgs)
+}
+
 # =======================
 # Tool Call Handler
 # =======================
 # This function executes the tools when the AI decides to call them
 # It's like a router that takes tool calls and runs the appropriate function
 
-def handle_tool_calls(tool_calls):
+async def invoke_tool(tool_call):
+    """
+    Run a single tool call and return its result.
+    
+    Args:
+        tool_call: One tool call object from the OpenAI response
+    
+    Returns:
+        dict or str: Whatever the tool returned - a str is already JSON
+        (empty dict if the tool doesn't exist)
+    """
+    # Extract the tool name (e.g., "record_user_details")
+    tool_name = tool_call.function.name
+    
+    # Parse the arguments (they come as a JSON string)
+    arguments = orjson.loads(tool_call.function.arguments)
+    
+    print(f"Tool called: {tool_name}", flush=True)
+    
+    # Look the tool up in the registry
+    # This avoids having a big if/elif chain, and unknown names simply aren't found
+    entry = tool_registry.get(tool_name)
+    if not entry:
+        return {}  # If tool not found, return empty dict
+    tool, args_model = entry
+    
+    # Check the arguments against the tool's schema
+    # Raises pydantic.ValidationError, which handle_tool_calls reports back to the AI
+    validated = args_model.model_validate(arguments)
+    
+    # Call the function with the validated arguments
+    # **arguments unpacks the dictionary as keyword arguments
+    # Example: record_user_details(email="test@example.com", name="John")
+    return await tool(**validated.model_dump())
+
+async def handle_tool_calls(tool_calls, running=None):
     """
     Execute tool calls requested by the AI.
     
     When the AI wants to use a tool, it returns tool_calls in its response.
     This function:
-    1. Extracts the tool name and arguments
-    2. Calls the corresponding Python function
+    1. Starts every tool call at the same time
+    2. Waits for all of them to finish
     3. Returns the results in a format the AI can understand
     
     Args:
         tool_calls: List of tool call objects from OpenAI response
+        running (dict): Tasks already started for some of the tool calls,
+            keyed by tool call id - these are awaited instead of run again
     
     Returns:
         list: List of tool response messages to send back to the AI
     """
+    running = running or {}
+    
+    # The AI might call multiple tools at once - they don't depend on each
+    # other, so run them concurrently instead of one after another
+    # return_exceptions=True stops one failing tool from cancelling the rest
+    raw_results = await asyncio.gather(
+        *(running.get(tool_call.id) or invoke_tool(tool_call) for tool_call in tool_calls),
+        return_exceptions=True
+    )
+    
     results = []
     
-    # Loop through each tool call (AI might call multiple tools at once)
-    for tool_call in tool_calls:
-        # Extract the tool name (e.g., "record_user_details")
-        tool_name = tool_call.function.name
-        
-        # Parse the arguments (they come as a JSON string)
-        arguments = json.loads(tool_call.function.arguments)
-        
-        print(f"Tool called: {tool_name}", flush=True)
-        
-        # Use globals() to get the function by name dynamically
-        # This avoids having a big if/elif chain
-        # globals() returns a dictionary of all global variables/functions
-        tool = globals().get(tool_name)
-        
-        # Call the function with the arguments if it exists
-        # **arguments unpacks the dictionary as keyword arguments
-        # Example: record_user_details(email="test@example.com", name="John")
-        if tool:
-            result = tool(**arguments)
-        else:
-            result = {}  # If tool not found, return empty dict
+    # gather() returns results in the same order as tool_calls,
+    # so each response lines up with the tool call that produced it
+    for tool_call, result in zip(tool_calls, raw_results):
+        if isinstance(result, Exception):
+            print(f"✗ Tool {tool_call.function.name} failed: {result}", flush=True)
+            result = {"error": str(result)}
         
         # Format the result for the AI
         # The AI expects tool responses in a specific format
+        # Tools that return a str have already given us JSON, so use it as-is
+        content = result if isinstance(result, str) else orjson.dumps(result).decode()
         results.append({
             "role": "tool",  # This is a tool response
-            "content": json.dumps(result),  # Convert result to JSON string
+            "content": content,  # The result as a JSON string
             "tool_call_id": tool_call.id  # Link this response to the original tool call
         })
     
@@ -272,38 +381,218 @@ def handle_tool_calls(tool_calls):
 # =======================
 # Load your LinkedIn profile and summary to give the AI context about you
 
-# Read the LinkedIn PDF
-reader = PdfReader("me/linkedin.pdf")
-linkedin = ""
-for page in reader.pages:
-    text = page.extract_text()
-    if text:
-        linkedin += text
+def extract_page_text(page_index, pdf_path):
+    """
+    Extract the text of one page of a PDF.
+    
+    This runs in a worker process, so it opens its own PdfReader.
+    
+    Args:
+        page_index (int): Which page to read (0-based)
+        pdf_path (str): Path to the PDF
+    
+    Returns:
+        str: The page's text (empty string if the page has none)
+    """
+    return PdfReader(pdf_path).pages[page_index].extract_text() or ""
 
-# Read the summary text file
-with open("me/summary.txt", "r", encoding="utf-8") as f:
-    summary = f.read()
+def load_linkedin(pdf_path="me/linkedin.pdf"):
+    """
+    Read the text out of the LinkedIn PDF, using a cached copy when possible.
+    
+    Extracting text with pypdf is slow, and it would otherwise run on every
+    restart. The extracted text is saved next to the PDF in a cache file
+    named after the PDF's modification time and size, so replacing the PDF
+    automatically invalidates the cache (and the old cache file is removed).
+    
+    Args:
+        pdf_path (str): Path to the LinkedIn profile PDF
+    
+    Returns:
+        str: The text of every page joined together
+    """
+    key = f"{os.path.getmtime(pdf_path)}-{os.path.getsize(pdf_path)}"
+    cache_path = os.path.join(os.path.dirname(pdf_path), f".linkedin.cache.txt.{key}")
+    
+    # Cache hit - a single file read instead of parsing the PDF
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+    
+    # Cache miss - parse the PDF once and save the result for next time
+    # Text extraction is CPU-bound pure Python, so spread the pages over
+    # several processes. We only do this with "fork": other start methods
+    # re-import this script in every worker, which would load the PDF again.
+    # Forking once other threads are running (e.g. the server has already started)
+    # can deadlock the workers, so then the pages are read in this process instead
+    reader = PdfReader(pdf_path)
+    page_count = len(reader.pages)
+    can_fork = "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+    if page_count > 1 and can_fork:
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork")) as executor:
+            parts = list(executor.map(partial(extract_page_text, pdf_path=pdf_path), range(page_count)))
+    else:
+        parts = [page.extract_text() or "" for page in reader.pages]
+    
+    # Join once at the end - adding to a string with += copies the whole string every time
+    linkedin = "".join(parts)
+    
+    # Write to a temp file and rename, so a crash never leaves a half-written cache
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(linkedin)
+    os.replace(tmp_path, cache_path)
+    
+    # Remove caches left over from older versions of the PDF
+    for old in glob.glob(os.path.join(os.path.dirname(pdf_path), ".linkedin.cache.txt.*")):
+        if old != cache_path:
+            os.remove(old)
+    
+    return linkedin
+
+# Section headings used in LinkedIn's "Save to PDF" export
+linkedin_section_re = re.compile(
+    r"\n(?=(?:Contact|Top Skills|Languages|Certifications|Honors-Awards|Publications|Patents|"
+    r"Summary|Experience|Education|Interests)\s*\n)"
+)
+
+# Sections that don't help answer career questions - add any others you want to leave out
+linkedin_skip_sections = {"Interests"}
+
+def trim_linkedin(text):
+    """
+    Shrink the LinkedIn text before it goes into the system prompt.
+    
+    The whole profile is sent with every message, so every token saved here
+    is saved on every turn. This removes the "Page X of Y" footers, squeezes
+    runs of blank lines and spaces, and drops the sections listed in
+    linkedin_skip_sections.
+    
+    Args:
+        text (str): The raw text extracted from the LinkedIn PDF
+    
+    Returns:
+        str: The trimmed text
+    """
+    text = re.sub(r"^\s*Page \d+ of \d+\s*$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n", text)
+    
+    sections = linkedin_section_re.split(text)
+    kept = [
+        section for section in sections
+        if section.strip().split("\n", 1)[0].strip() not in linkedin_skip_sections
+    ]
+    return "\n".join(kept).strip()
 
 # Set your name (UPDATE THIS WITH YOUR NAME!)
 name = "Anjani Prakash"  # Change this to your name
 
+@lru_cache(maxsize=1)
+def get_context():
+    """
+    Load the summary and LinkedIn profile the first time they are needed.
+    
+    Reading the PDF is the slowest part of starting up, so it isn't done at
+    import time - importing this module (e.g. from a test) stays fast.
+    lru_cache means the files are only read once per process.
+    
+    Returns:
+        tuple: (summary, linkedin) text
+    """
+    # Read the LinkedIn PDF
+    linkedin = trim_linkedin(load_linkedin("me/linkedin.pdf"))
+    
+    # Read the summary text file
+    with open("me/summary.txt", "r", encoding="utf-8") as f:
+        summary = f.read()
+    
+    return summary, linkedin
+
 # =======================
 # System Prompt
 # =======================
 # This tells the AI how to behave and what its role is
 # The system prompt is crucial - it sets the AI's personality and instructions
 
-system_prompt = f"""You are acting as {name}. You are answering questions on {name}'s website, \
+@lru_cache(maxsize=1)
+def get_system_message():
+    """
+    Build the system message (instructions + summary + LinkedIn profile) once.
+    
+    The system message never changes, so it is built on the first chat and
+    reused after that. Keeping it identical at the start of every request
+    also lets OpenAI's automatic prompt caching reuse the work for this long
+    prefix.
+    
+    Returns:
+        dict: The system message in OpenAI's format
+    """
+    summary, linkedin = get_context()
+    
+    system_prompt = f"""You are acting as {name}. You are answering questions on {name}'s website, \
 particularly questions related to {name}'s career, background, skills and experience. \
 Your responsibility is to represent {name} for interactions on the website as faithfully as possible. \
 You are given a summary of {name}'s background and LinkedIn profile which you can use to answer questions. \
 Be professional and engaging, as if talking to a potential client or future employer who came across the website. \
 If you don't know the answer to any question, use your record_unknown_question tool to record the question that you couldn't answer, even if it's about something trivial or unrelated to career. \
 If the user is engaging in discussion, try to steer them towards getting in touch via email; ask for their email and record it using your record_user_details tool."""
+    
+    # Add the context (summary and LinkedIn profile) to the system prompt
+    system_prompt += f"\n\n## Summary:\n{summary}\n\n## LinkedIn Profile:\n{linkedin}\n\n"
+    system_prompt += f"With this context, please chat with the user, always staying in character as {name}."
+    
+    return {"role": "system", "content": system_prompt}
 
-# Add the context (summary and LinkedIn profile) to the system prompt
-system_prompt += f"\n\n## Summary:\n{summary}\n\n## LinkedIn Profile:\n{linkedin}\n\n"
-system_prompt += f"With this context, please chat with the user, always staying in character as {name}."
+# =======================
+# Tool Loop Limits
+# =======================
+# A confused model could keep calling tools forever, and every round re-sends the
+# whole (growing) conversation. These limits stop that from running up the bill
+max_tool_rounds = 8  # Most tool calls before the AI must give a final answer
+max_prompt_tokens = 100_000  # Stop calling tools once the conversation gets this big
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Load the gpt-4o-mini tokenizer on first use (tiktoken may need to download it)."""
+    return tiktoken.encoding_for_model("gpt-4o-mini")
+
+@lru_cache(maxsize=1)
+def get_system_prompt_tokens():
+    """Count the system prompt's tokens once - it never changes."""
+    return len(get_encoding().encode(get_system_message()["content"]))
+
+def count_message_tokens(msg):
+    """
+    Roughly count the tokens in one message.
+    
+    Args:
+        msg (dict): A message in OpenAI's format
+    
+    Returns:
+        int: Number of tokens in the message content and tool call arguments
+    """
+    if msg is get_system_message():
+        return get_system_prompt_tokens()
+    encoding = get_encoding()
+    total = 0
+    if isinstance(msg.get("content"), str):
+        total += len(encoding.encode(msg["content"]))
+    for tool_call in msg.get("tool_calls") or []:
+        total += len(encoding.encode(tool_call["function"]["arguments"]))
+    return total
+
+def count_tokens(messages):
+    """
+    Roughly count the tokens in a list of messages.
+    
+    Args:
+        messages (list): Messages in OpenAI's format
+    
+    Returns:
+        int: Number of tokens in the message contents and tool call arguments
+    """
+    return sum(count_message_tokens(msg) for msg in messages)
 
 # =======================
 # Chat Function
@@ -311,66 +600,152 @@ system_prompt += f"With this context, please chat with the user, always staying
 # This is the main function that handles conversations
 # It uses OpenAI's function calling feature to allow the AI to use tools
 
-def chat(message, history):
+def build_tool_call(part):
+    """
+    Turn the fragments of one streamed tool call into a tool call object.
+    
+    When streaming, OpenAI sends each tool call in pieces: the id and name
+    arrive first, and the JSON arguments arrive a few characters at a time.
+    
+    Args:
+        part (dict): The collected "id", "name" and "arguments" of the tool call
+    
+    Returns:
+        ChatCompletionMessageToolCall: The complete tool call
+    """
+    return ChatCompletionMessageToolCall(
+        id=part["id"],
+        type="function",
+        function=Function(name=part["name"], arguments=part["arguments"])
+    )
+
+async def chat(message, history):
     """
     Main chat function that handles user messages and tool calls.
     
+    This is an async generator: Gradio awaits it on its event loop, so many
+    chats can be waiting on OpenAI at the same time, and every time it yields
+    the UI updates with the partial reply - the user sees the first words
+    straight away instead of waiting for the whole answer.
+    
     This function:
-    1. Sends the user's message to OpenAI
-    2. Checks if the AI wants to call any tools
-    3. If yes, calls the tools and sends results back to the AI
+    1. Sends the user's message to OpenAI as a streaming request
+    2. Yields the reply text as it arrives
+    3. If the AI asks for tools instead, calls them and sends results back
     4. Repeats until the AI has a final answer
-    5. Returns the AI's response
+    
+    Tools are started while the response is still streaming: as soon as one
+    tool call is complete it runs in the background while the AI is still
+    writing out the next one.
     
     Args:
         message (str): The user's message
         history (list): Previous conversation messages
     
-    Returns:
-        str: The AI's response to the user
+    Yields:
+        str: The AI's response so far
     """
     # Build the message list for OpenAI
     # Format: [system message, ...history, new user message]
-    messages = [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": message}]
+    # The first call loads and parses the profile, so it runs in a worker thread - when the
+    # app is imported instead of run as __main__, it isn't loaded yet and would block every chat
+    system_message = await asyncio.to_thread(get_system_message)
+    messages = [system_message, *history, {"role": "user", "content": message}]
+    
+    # Count the conversation once (off the event loop - long histories take a while
+    # to encode), then keep a running total as tool rounds add messages
+    prompt_tokens = await asyncio.to_thread(count_tokens, messages)
     
     done = False
+    rounds = 0
     
     # Loop until we get a final answer (not a tool call)
     while not done:
+        rounds += 1
+        
+        # Too many tool rounds, or the conversation is getting too big?
+        # Then tell the AI to stop and make this request its final answer
+        out_of_budget = rounds > max_tool_rounds or prompt_tokens > max_prompt_tokens
+        if out_of_budget:
+            print("Tool loop limit reached - asking for a final answer", flush=True)
+            messages.append({
+                "role": "system",
+                "content": "Tool loop exhausted - you can't use any more tools. Answer the user now with what you have."
+            })
+        
         # Call OpenAI with the messages and available tools
         # The AI will decide if it needs to use any tools
-        response = openai.chat.completions.create(
+        # stream=True gives us the response in small chunks as it is generated
+        stream = await openai.chat.completions.create(
             model="gpt-4o-mini",
             messages=messages,
-            tools=tools  # Tell OpenAI what tools are available
+            tools=tools,  # Tell OpenAI what tools are available
+            tool_choice="none" if out_of_budget else "auto",  # "none" forces a text answer
+            stream=True
         )
         
-        # Check why the AI stopped generating
-        finish_reason = response.choices[0].finish_reason
+        reply = ""
+        tool_call_parts = {}  # Tool call fragments, keyed by their index
+        running = {}  # Tool calls already started, keyed by tool call id
+        finish_reason = None
+        
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            
+            # Text for the user - show it as soon as it arrives
+            if delta.content:
+                reply += delta.content
+                yield reply
+            
+            # Pieces of tool calls - collect them as they arrive
+            for tool_call_delta in delta.tool_calls or []:
+                # Tool calls are streamed one after another, so when a new one
+                # starts the previous ones are complete - start running them now
+                if tool_call_delta.index not in tool_call_parts:
+                    for part in tool_call_parts.values():
+                        if part["id"] not in running:
+                            running[part["id"]] = asyncio.create_task(invoke_tool(build_tool_call(part)))
+                
+                part = tool_call_parts.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": ""})
+                if tool_call_delta.id:
+                    part["id"] = tool_call_delta.id
+                if tool_call_delta.function and tool_call_delta.function.name:
+                    part["name"] += tool_call_delta.function.name
+                if tool_call_delta.function and tool_call_delta.function.arguments:
+                    part["arguments"] += tool_call_delta.function.arguments
+            
+            # Check why the AI stopped generating
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
         
         # If the AI wants to call tools, execute them
-        if finish_reason == "tool_calls":
-            # Get the AI's message (which contains tool calls)
-            message_obj = response.choices[0].message
-            tool_calls = message_obj.tool_calls
+        if finish_reason == "tool_calls" and not out_of_budget:
+            # Keep the order the AI emitted the tool calls in
+            tool_calls = [build_tool_call(part) for _, part in sorted(tool_call_parts.items())]
             
-            # Execute the tools
-            results = handle_tool_calls(tool_calls)
+            # Execute the remaining tools and wait for the ones already running
+            results = await handle_tool_calls(tool_calls, running)
             
             # Add the AI's message (with tool calls) to the conversation
-            messages.append(message_obj)
+            assistant_message = {
+                "role": "assistant",
+                "content": reply or None,
+                "tool_calls": [tool_call.model_dump() for tool_call in tool_calls]
+            }
+            messages.append(assistant_message)
             
             # Add the tool results to the conversation
             # The AI will read these and generate a response
             messages.extend(results)
+            prompt_tokens += count_tokens([assistant_message, *results])
             
             # Continue the loop - the AI will process the tool results
         else:
-            # AI has a final answer, we're done!
+            # AI has a final answer (already yielded above), we're done!
             done = True
-    
-    # Return the AI's final response
-    return response.choices[0].message.content
 
 # =======================
 # Launch Gradio Interface
@@ -386,7 +761,25 @@ if __name__ == "__main__":
     print("Launching Gradio interface...")
     print("="*60)
     
+    # Load the profile now rather than on the first chat, so the first user
+    # doesn't wait for it (and forked workers inherit the loaded text)
+    # The tokenizer and the system prompt's token count are warmed up here too, so
+    # the first chat doesn't download the encoding or encode the whole profile
+    get_system_message()
+    get_system_prompt_tokens()
+    
     # Create a chat interface using Gradio
     # type="messages" means it uses OpenAI's message format
-    gr.ChatInterface(chat, type="messages").launch()
+    demo = gr.ChatInterface(chat, type="messages")
+    
+    # Configure the request queue explicitly so multi-user traffic is predictable
+    # default_concurrency_limit: how many chats run at once (~ target QPS x median
+    #   chat latency - chats are I/O-bound, so 8 is safe even on a single vCPU)
+    # max_size: how many chats can wait in line before new ones are turned away
+    demo.queue(default_concurrency_limit=8, max_size=64)
+    
+    # launch() blocks until the server is stopped. The shared OpenAI and Pushover
+    # connection pools live on Gradio's event loop, so they aren't closed from here -
+    # the sockets are released when the process exits
+    demo.launch(max_threads=40)
 
@@ -2,17 +2,30 @@
 
 """
 This script compares the performance of different LLMs on a given task.
+
+Run with --batch for offline/benchmark runs: every OpenAI request is then sent
+through the OpenAI Batch API, which costs half as much but can take up to 24h.
 """
 
 import os
-import json
+import io
+import orjson  # Faster drop-in for the json module
+import time
+import argparse
+import asyncio
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 # =======================
 # Setup and Configuration
 # =======================
 
+parser = argparse.ArgumentParser(description="Compare LLMs on a generated question")
+parser.add_argument("--batch", action="store_true",
+                    help="send OpenAI requests through the Batch API (50%% cheaper, up to 24h turnaround)")
+args = parser.parse_args()
+
 load_dotenv(override=True)
 
 openai_api_key = os.getenv('OPENAI_API_KEY')
@@ -29,6 +42,75 @@ if google_api_key:
 else:
     print("Google API Key not set")
 
+# =======================
+# OpenAI Batch API Helpers
+# =======================
+
+openai = OpenAI()
+
+def run_batch(requests, poll_interval=30):
+    """
+    Send chat completion requests through the OpenAI Batch API and wait for them.
+
+    requests is a list of (custom_id, model_name, messages) tuples.
+    Returns a dict mapping each custom_id to the reply text.
+    """
+    lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model_name, "messages": messages},
+        })
+        for custom_id, model_name, messages in requests
+    ]
+    batch_file = openai.files.create(
+        file=("batch.jsonl", io.BytesIO(b"\n".join(lines))),
+        purpose="batch",
+    )
+    batch = openai.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Submitted batch {batch.id} - waiting for it to complete...")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(poll_interval)
+        batch = openai.batches.retrieve(batch.id)
+        print(f"  batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+
+    # A "completed" batch can still have failed requests - they are written to a
+    # separate error file instead of the output file (and if every request failed,
+    # there is no output file at all)
+    if batch.request_counts.failed or batch.error_file_id or not batch.output_file_id:
+        errors = openai.files.content(batch.error_file_id).text if batch.error_file_id else "no error file"
+        raise RuntimeError(
+            f"Batch {batch.id}: {batch.request_counts.failed} of {batch.request_counts.total} requests failed\n{errors}"
+        )
+
+    replies = {}
+    output = openai.files.content(batch.output_file_id).text
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        result = orjson.loads(line)
+        replies[result["custom_id"]] = result["response"]["body"]["choices"][0]["message"]["content"]
+    return replies
+
+def ask_openai(custom_id, model_name, messages):
+    """Get one reply from OpenAI - through the Batch API when --batch is set."""
+    if args.batch:
+        return run_batch([(custom_id, model_name, messages)])[custom_id]
+    response = openai.chat.completions.create(
+        model=model_name,
+        messages=messages,
+    )
+    return response.choices[0].message.content
+
 # =======================
 # Generate Question
 # =======================
@@ -42,12 +124,7 @@ print("\n" + "="*60)
 print("Generating question...")
 print("="*60)
 
-openai = OpenAI()
-response = openai.chat.completions.create(
-    model="gpt-5-nano",
-    messages=messages,
-)
-question = response.choices[0].message.content
+question = ask_openai("question", "gpt-5-nano", messages)
 print(f"\nQuestion: {question}\n")
 
 # 
@@ -71,52 +148,59 @@ print("="*60)
 # These models can be quite slow - like 1-2 minutes - but they do a great job!
 # Feel free to switch them for faster models if you'd prefer.
 
-# ----------------------------------------------------------------------------
-# OpenAI GPT
-# ----------------------------------------------------------------------------
-print("\n[1/3] Querying OpenAI GPT...")
-model_name = "gpt-5-nano"
-response = openai.chat.completions.create(
-    model=model_name,
-    messages=messages,
-)
-answer = response.choices[0].message.content
-print(f"\nAnswer: {answer}\n")
-
-competitors.append(model_name)
-answers.append(answer)
-
-# ----------------------------------------------------------------------------
-# Google Gemini 
-# ----------------------------------------------------------------------------
-print("\n[2/3] Querying Google Gemini...")
-model_name = "gemini-2.0-flash"
-google = OpenAI(api_key=google_api_key, base_url="https://generativelanguage.googleapis.com/v1beta/openai/")
-response = google.chat.completions.create(
-    model=model_name,
-    messages=messages,
-)
-answer = response.choices[0].message.content
-print(f"\nAnswer: {answer}\n")
-
-competitors.append(model_name)
-answers.append(answer)
-
-# ----------------------------------------------------------------------------
-# Ollama (Local Model)
-# ----------------------------------------------------------------------------
-print("\n[3/3] Querying Ollama (local)...")
-model_name = "llama3.2"
-ollama = OpenAI(api_key='ollama', base_url="http://localhost:11434/v1")
-response = ollama.chat.completions.create(
-    model=model_name,
-    messages=messages,
+# The three competitors are independent of each other, so instead of waiting
+# for each round trip in turn we fire all three requests at once with
+# AsyncOpenAI and asyncio.gather. Total time is roughly the slowest model,
+# not the sum of all three.
+
+# All three clients share one keep-alive connection pool, so connections are
+# reused instead of each request paying for its own TCP + TLS handshake
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=60,
 )
-answer = response.choices[0].message.content
-print(f"\nAnswer: {answer}\n")
 
-competitors.append(model_name)
-answers.append(answer)
+openai_async = AsyncOpenAI(http_client=http_client)
+google_async = AsyncOpenAI(api_key=google_api_key, base_url="https://generativelanguage.googleapis.com/v1beta/openai/", http_client=http_client)
+ollama_async = AsyncOpenAI(api_key='ollama', base_url="http://localhost:11434/v1", http_client=http_client)
+
+async def query(client, model_name):
+    """Send the question to one competitor and return (model_name, answer)."""
+    response = await client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+    )
+    return model_name, response.choices[0].message.content
+
+async def query_batch(model_name):
+    """Same as query(), but through the OpenAI Batch API (only OpenAI supports it)."""
+    # run_batch blocks while it polls, so run it in a thread to keep the
+    # other competitors going at the same time
+    answer = await asyncio.to_thread(ask_openai, f"comp-{model_name}", model_name, messages)
+    return model_name, answer
+
+async def query_all():
+    # return_exceptions=True means one failing provider (e.g. Ollama not running)
+    # doesn't throw away the answers from the others
+    return await asyncio.gather(
+        query_batch("gpt-5-nano") if args.batch else query(openai_async, "gpt-5-nano"),  # OpenAI GPT
+        query(google_async, "gemini-2.0-flash"),   # Google Gemini
+        query(ollama_async, "llama3.2"),           # Ollama (local model)
+        return_exceptions=True,
+    )
+
+print("\nQuerying OpenAI GPT, Google Gemini and Ollama (local) in parallel...")
+competitor_results = asyncio.run(query_all())
+
+for result in competitor_results:
+    if isinstance(result, Exception):
+        print(f"\nError querying competitor: {result}\n")
+        continue
+    model_name, answer = result
+    print(f"\n[{model_name}] Answer: {answer}\n")
+
+    competitors.append(model_name)
+    answers.append(answer)
 
 # =======================
 # Display Results
@@ -139,10 +223,11 @@ for competitor, answer in zip(competitors, answers):
     print("\n" + "-"*60)
 
 # Let's bring this together - note the use of "enumerate"
-together = ""
-for index, answer in enumerate(answers):
-    together += f"# Response from competitor {index+1}\n\n"
-    together += answer + "\n\n"
+# Each response goes into a list that is joined once, rather than growing a string with +=
+together = "".join(
+    f"# Response from competitor {index+1}\n\n{answer}\n\n"
+    for index, answer in enumerate(answers)
+)
 
 # =======================
 # Judge the Responses
@@ -171,22 +256,18 @@ judge_messages = [{"role": "user", "content": judge}]
 
 
 print("\nSending to judge (GPT-5-nano)...")
-response = openai.chat.completions.create(
-    model="gpt-5-nano",
-    messages=judge_messages,
-)
-results = response.choices[0].message.content
+results = ask_openai("judge", "gpt-5-nano", judge_messages)
 print(f"\nJudge's response:\n{results}")
 
 # OK let's turn this into results!
 try:
-    results_dict = json.loads(results)
+    results_dict = orjson.loads(results)
     ranks = results_dict["results"]
     print("\nRankings (best to worst):")
     for index, result in enumerate(ranks):
         competitor = competitors[int(result)-1]
         print(f"Rank {index+1}: {competitor}")
-except json.JSONDecodeError as e:
+except orjson.JSONDecodeError as e:
     print(f"\nError parsing judge's response as JSON: {e}")
     print("Raw response:")
     print(results)
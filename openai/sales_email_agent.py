@@ -40,21 +40,35 @@ Note: For production, you'll need to verify your own domain. The free tier allow
 """
 
 from dotenv import load_dotenv
-from agents import Agent, Runner, trace, function_tool
+from agents import Agent, Runner, trace, function_tool, set_default_openai_client
+from openai import AsyncOpenAI
 from openai.types.responses import ResponseTextDeltaEvent
 from typing import Dict
+from pydantic import BaseModel
+import httpx
+import json
 import resend
 import os
 import asyncio
+from functools import lru_cache
 
 load_dotenv(override=True)
 
+# One shared OpenAI client for every agent, with a pre-sized keep-alive pool.
+# The parallel examples below fire several requests at once - sharing the pool
+# means they reuse connections instead of each doing its own TCP + TLS setup.
+openai_client = AsyncOpenAI(
+    http_client=httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=8))
+)
+set_default_openai_client(openai_client)
+
+# Set the Resend API key once, rather than inside every send function
+resend.api_key = os.environ.get('RESEND_API_KEY')
+
 # Let's just check emails are working for you
 
 def send_test_email():
     """Send a test email using Resend"""
-    resend.api_key = os.environ.get('RESEND_API_KEY')
-    
     # For testing, you can use onboarding@resend.dev
     # For production, use your verified domain email
     params = {
@@ -146,6 +160,27 @@ async def parallel_cold_emails():
     for output in outputs:
         print(output + "\n\n")
 
+# When you want several drafts from the SAME agent, you don't need 3 separate runs:
+# n=3 asks for 3 samples in a single request, so the prompt is only sent (and
+# prefilled) once. This only works when the input is identical - the three
+# personas above have different instructions, so they still need their own calls.
+async def drafts_from_one_persona(n=3):
+    message = "Write a cold sales email"
+    
+    response = await openai_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": instructions1},
+            {"role": "user", "content": message},
+        ],
+        n=n,
+    )
+    
+    outputs = [choice.message.content for choice in response.choices]
+    
+    for output in outputs:
+        print(output + "\n\n")
+
 sales_picker = Agent(
     name="sales_picker",
     instructions="You pick the best cold sales email from the given options. \
@@ -185,25 +220,6 @@ Now we will add a tool to the mix.
 Remember all that json boilerplate and the `handle_tool_calls()` function with the if logic..
 """
 
-# Re-initialize agents for Part 2
-sales_agent1 = Agent(
-        name="Professional Sales Agent",
-        instructions=instructions1,
-        model="gpt-4o-mini",
-)
-
-sales_agent2 = Agent(
-        name="Engaging Sales Agent",
-        instructions=instructions2,
-        model="gpt-4o-mini",
-)
-
-sales_agent3 = Agent(
-        name="Busy Sales Agent",
-        instructions=instructions3,
-        model="gpt-4o-mini",
-)
-
 """
 ## Steps 2 and 3: Tools and Agent interactions
 
@@ -213,10 +229,8 @@ Simply wrap your function with the decorator `@function_tool`
 """
 
 @function_tool
-def send_email(body: str):
+async def send_email(body: str):
     """ Send out an email with the given body to all sales prospects """
-    resend.api_key = os.environ.get('RESEND_API_KEY')
-    
     params = {
         "from": "onboarding@resend.dev",  # Change to your verified sender
         "to": ["your-email@example.com"],  # Change to your recipient
@@ -224,7 +238,9 @@ def send_email(body: str):
         "text": body,
     }
     
-    email = resend.Emails.send(params)
+    # resend.Emails.send is a blocking HTTP call - run it in a thread so the
+    # agents sharing this event loop keep going while the email is sent
+    email = await asyncio.to_thread(resend.Emails.send, params)
     return {"status": "success", "email_id": email.get('id')}
 
 """
@@ -265,8 +281,15 @@ Crucial Rules:
 """
 
 
+# The Sales Manager is built once and reused by every run, instead of building a new
+# Agent (and its tool schemas) each call. Call get_sales_manager.cache_clear() if you
+# change instructions or tools and want a fresh one.
+@lru_cache(maxsize=1)
+def get_sales_manager():
+    return Agent(name="Sales Manager", instructions=instructions, tools=tools, model="gpt-4o-mini")
+
 async def sales_manager_example():
-    sales_manager = Agent(name="Sales Manager", instructions=instructions, tools=tools, model="gpt-4o-mini")
+    sales_manager = get_sales_manager()
     
     message = "Send a cold sales email addressed to 'Dear CEO'"
     
@@ -311,17 +334,28 @@ html_instructions = "You can convert a text email body to an HTML email body. \
 You are given a text email body which might have some markdown \
 and you need to convert it to an HTML email body with simple, clear, compelling layout and design."
 
-subject_writer = Agent(name="Email subject writer", instructions=subject_instructions, model="gpt-4o-mini")
-subject_tool = subject_writer.as_tool(tool_name="subject_writer", tool_description="Write a subject for a cold sales email")
-
-html_converter = Agent(name="HTML email body converter", instructions=html_instructions, model="gpt-4o-mini")
-html_tool = html_converter.as_tool(tool_name="html_converter", tool_description="Convert a text email body to an HTML email body")
+# Writing the subject and converting to HTML used to be two separate agent tools, i.e. two
+# LLM round-trips. Both only need the email body, so one structured-output call does both.
+class Email(BaseModel):
+    subject: str
+    html_body: str
 
 @function_tool
-def send_html_email(subject: str, html_body: str) -> Dict[str, str]:
-    """ Send out an email with the given subject and HTML body to all sales prospects """
-    resend.api_key = os.environ.get('RESEND_API_KEY')
-    
+async def format_email(body: str) -> Dict[str, str]:
+    """ Write a subject for a cold sales email and convert its text body to an HTML body """
+    response = await openai_client.beta.chat.completions.parse(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": subject_instructions + " " + html_instructions},
+            {"role": "user", "content": body},
+        ],
+        response_format=Email,
+    )
+    email = response.choices[0].message.parsed
+    return {"subject": email.subject, "html_body": email.html_body}
+
+def deliver_html_email(subject: str, html_body: str) -> Dict[str, str]:
+    """ Send an email with the given subject and HTML body via Resend """
     params = {
         "from": "onboarding@resend.dev",  # Change to your verified sender
         "to": ["your-email@example.com"],  # Change to your recipient
@@ -332,10 +366,15 @@ def send_html_email(subject: str, html_body: str) -> Dict[str, str]:
     email = resend.Emails.send(params)
     return {"status": "success", "email_id": email.get('id')}
 
-tools_html = [subject_tool, html_tool, send_html_email]
+@function_tool
+async def send_html_email(subject: str, html_body: str) -> Dict[str, str]:
+    """ Send out an email with the given subject and HTML body to all sales prospects """
+    return await asyncio.to_thread(deliver_html_email, subject, html_body)
+
+tools_html = [format_email, send_html_email]
 
 instructions_emailer = "You are an email formatter and sender. You receive the body of an email to be sent. \
-You first use the subject_writer tool to write a subject for the email, then use the html_converter tool to convert the body to HTML. \
+You first use the format_email tool to write a subject for the email and convert the body to HTML. \
 Finally, you use the send_html_email tool to send the email with the subject and HTML body."
 
 
@@ -372,13 +411,23 @@ Crucial Rules:
 """
 
 
-async def automated_sdr_example():
-    sales_manager = Agent(
+# Same idea for the SDR version of the Sales Manager (tools + handoff)
+@lru_cache(maxsize=1)
+def get_sdr_sales_manager():
+    return Agent(
         name="Sales Manager",
         instructions=sales_manager_instructions,
         tools=tools_final,
         handoffs=handoffs,
         model="gpt-4o-mini")
+
+async def automated_sdr_example(batch: bool = False):
+    """ Run the automated SDR. Returns the agent's RunResult, or with batch=True the
+    Resend response for the sent email - the batch path is a fixed workflow, not an agent run """
+    if batch:
+        return await automated_sdr_batch()
+    
+    sales_manager = get_sdr_sales_manager()
     
     message = "Send out a cold sales email addressed to Dear CEO from Alice"
     
@@ -387,6 +436,105 @@ async def automated_sdr_example():
     
     return result
 
+"""
+### Scheduled runs: the Batch API
+
+When nobody is waiting for the result (e.g. a nightly outreach job), the same steps
+can go through the OpenAI Batch API instead: half the price and a separate, higher
+rate limit - but results can take up to 24 hours.
+
+The Agents SDK can't run through the Batch API, so automated_sdr_example(batch=True)
+runs the same plan as a fixed workflow: 3 drafts -> pick the best -> subject + HTML -> send.
+There's no agent run to return, so it returns the Resend response for the sent email instead.
+"""
+
+def json_schema_format(model):
+    """ The response_format for a batch request whose reply must match a Pydantic model """
+    # parse() builds this automatically, but batch requests are plain JSON, so we write it out
+    schema = {**model.model_json_schema(), "additionalProperties": False}
+    return {"type": "json_schema", "json_schema": {"name": model.__name__, "schema": schema, "strict": True}}
+
+async def run_batch(requests, poll_interval=60, response_format=None):
+    """ Run (custom_id, instructions, input) chat requests as one batch and return {custom_id: reply}
+    Pass a Pydantic model as response_format to get structured JSON replies back """
+    body = {"model": "gpt-4o-mini"}
+    if response_format:
+        body["response_format"] = json_schema_format(response_format)
+    lines = [
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                **body,
+                "messages": [
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": user_input},
+                ],
+            },
+        })
+        for custom_id, instructions, user_input in requests
+    ]
+    batch_file = await openai_client.files.create(
+        file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    batch = await openai_client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Submitted batch {batch.id}")
+    
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        batch = await openai_client.batches.retrieve(batch.id)
+        print(f"Batch {batch.id}: {batch.status}")
+    
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+    
+    # A "completed" batch can still have failed requests - they go to a separate
+    # error file, and if all of them failed there is no output file at all
+    if batch.request_counts.failed or batch.error_file_id or not batch.output_file_id:
+        errors = (await openai_client.files.content(batch.error_file_id)).text if batch.error_file_id else "no error file"
+        raise RuntimeError(
+            f"Batch {batch.id}: {batch.request_counts.failed} of {batch.request_counts.total} requests failed\n{errors}"
+        )
+    
+    output = await openai_client.files.content(batch.output_file_id)
+    replies = {}
+    for line in output.text.splitlines():
+        if line.strip():
+            result = json.loads(line)
+            replies[result["custom_id"]] = result["response"]["body"]["choices"][0]["message"]["content"]
+    return replies
+
+async def automated_sdr_batch():
+    message = "Write a cold sales email addressed to Dear CEO from Alice"
+    
+    # 1. Three drafts, one from each sales agent
+    drafts = await run_batch([
+        ("draft-1", instructions1, message),
+        ("draft-2", instructions2, message),
+        ("draft-3", instructions3, message),
+    ])
+    emails = "Cold sales emails:\n\n" + "\n\nEmail:\n\n".join(drafts[f"draft-{i}"] for i in range(1, 4))
+    
+    # 2. Pick the best one
+    best = (await run_batch([("pick", sales_picker.instructions, emails)]))["pick"]
+    
+    # 3. Subject and HTML body in one structured-output request, like the format_email tool -
+    #    free text could come back with a "Subject:" prefix or the HTML in a ```html fence
+    formatted = await run_batch(
+        [("format", subject_instructions + " " + html_instructions, best)],
+        response_format=Email,
+    )
+    email = Email.model_validate_json(formatted["format"])
+    
+    # 4. Send it - in a thread, like the send tools, so the event loop isn't blocked
+    return await asyncio.to_thread(deliver_html_email, email.subject, email.html_body)
+
 """
 ### Remember to check the trace
 
@@ -434,8 +582,10 @@ And a student has contributed a customer care agent in community_contributions t
 if __name__ == "__main__":
     # Uncomment the function you want to run:
     # asyncio.run(parallel_cold_emails())
+    # asyncio.run(drafts_from_one_persona())
     # asyncio.run(selection_from_sales_people())
     # asyncio.run(sales_manager_example())
     # asyncio.run(automated_sdr_example())
+    # asyncio.run(automated_sdr_example(batch=True))
     pass
 
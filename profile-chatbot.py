@@ -14,27 +14,82 @@ Replace the file in `me/linkedin.pdf` with your own LinkedIn profile PDF.
 # =======================
 # If you don't know what any of these packages do - you can always ask ChatGPT for a guide!
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
 from pypdf import PdfReader
 import gradio as gr
 from pydantic import BaseModel
 import os
+import re
+import glob
+import httpx
+import yaml
+import asyncio
+from collections import OrderedDict
 
 # =======================
 # Setup and Configuration
 # =======================
 load_dotenv(override=True)
-openai = OpenAI()
+
+# One long-lived connection pool shared by the OpenAI and Gemini clients (chat, evaluator and fallback).
+# Keep-alive means TLS + TCP handshakes are paid once, not on every turn.
+http_client = httpx.AsyncClient(
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+)
+# max_retries=0: the SDK's own retries are turned off, create_completion below does the retrying
+openai = AsyncOpenAI(http_client=http_client, max_retries=0)
+
+# =======================
+# Semantic Response Cache
+# =======================
+# Visitors ask the same few questions over and over ("what's your background?").
+# GPTCache stores accepted replies and returns them for similar questions, skipping
+# both the chat and the evaluation calls. It's optional - pip install gptcache to enable it.
+# Only opening questions (no history yet) are cached: the answer to a follow-up depends
+# on the conversation before it, so it can't safely be reused for another visitor.
+try:
+    from gptcache.adapter.api import init_similar_cache, get as cache_get, put as cache_put
+    init_similar_cache(data_dir="chatbot_cache")
+    response_cache_enabled = True
+except ImportError:
+    response_cache_enabled = False
+    print("gptcache not installed - semantic response cache disabled")
 
 # =======================
 # Load LinkedIn Profile
 # =======================
-reader = PdfReader("me/linkedin.pdf")
-linkedin = ""
-for page in reader.pages:
-    text = page.extract_text()
-    if text:
-        linkedin += text
+# Extracting text with pypdf is slow, so the result is cached in me/.linkedin.<key>.txt
+# The key is the PDF's modification time and size - replacing the PDF invalidates the cache
+def load_linkedin(pdf_path="me/linkedin.pdf"):
+    stat = os.stat(pdf_path)
+    key = f"{stat.st_mtime_ns}-{stat.st_size}"
+    cache_dir = os.path.dirname(pdf_path)
+    cache_path = os.path.join(cache_dir, f".linkedin.{key}.txt")
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    # Join the pages once - adding to a string with += copies it on every page
+    reader = PdfReader(pdf_path)
+    linkedin = "".join(text for page in reader.pages if (text := page.extract_text()))
+
+    # Write to a temp file and rename, so a crash never leaves a half-written cache
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(linkedin)
+    os.replace(tmp_path, cache_path)
+
+    # Remove caches left over from older versions of the PDF
+    for old in glob.glob(os.path.join(cache_dir, ".linkedin.*.txt")):
+        if old != cache_path:
+            os.remove(old)
+
+    return linkedin
+
+linkedin = load_linkedin("me/linkedin.pdf")
 
 # =======================
 # Load Summary
@@ -60,6 +115,22 @@ If you don't know the answer, say so."
 system_prompt += f"\n\n## Summary:\n{summary}\n\n## LinkedIn Profile:\n{linkedin}\n\n"
 system_prompt += f"With this context, please chat with the user, always staying in character as {name}."
 
+# system_prompt is built once and never changes, so it always goes first, on its own,
+# in every request. OpenAI (and Gemini) cache a prompt prefix that is byte-identical
+# across calls, so the long summary + LinkedIn block isn't re-processed every turn.
+# Anything that varies per turn is sent as a separate system message after it.
+pig_latin_instruction = "Everything in your reply needs to be in pig latin - \
+              it is mandatory that you respond only and entirely in pig latin"
+
+# The system messages themselves are also built once, here, and reused every turn
+system_message = {"role": "system", "content": system_prompt}
+pig_latin_message = {"role": "system", "content": pig_latin_instruction}
+
+# Words that switch on the pig latin reply. They're compiled into one regex, so adding
+# more triggers is still a single scan of the message per turn
+pig_latin_triggers = ["patent"]
+pig_latin_trigger_re = re.compile("|".join(re.escape(t) for t in pig_latin_triggers), re.IGNORECASE)
+
 # =======================
 # Evaluation Model
 # =======================
@@ -68,6 +139,10 @@ class Evaluation(BaseModel):
     is_acceptable: bool
     feedback: str
 
+# The cheap style check also says whether the reply makes claims that need the profile to verify
+class StyleEvaluation(Evaluation):
+    fact_check_needed: bool
+
 # =======================
 # Evaluator Setup
 # =======================
@@ -80,47 +155,203 @@ The Agent has been provided with context on {name} in the form of their summary
 evaluator_system_prompt += f"\n\n## Summary:\n{summary}\n\n## LinkedIn Profile:\n{linkedin}\n\n"
 evaluator_system_prompt += f"With this context, please evaluate the latest response, replying with whether the response is acceptable and your feedback."
 
+evaluator_system_message = {"role": "system", "content": evaluator_system_prompt}
+
+# Most rejections are about tone, which doesn't need the (large) profile at all. So every
+# reply first goes to this cheap style evaluator, and only replies that state checkable
+# specifics (dates, employers, titles, numbers) are sent on to the full evaluator above with the summary + LinkedIn context.
+style_evaluator_system_prompt = f"You are an evaluator that decides whether a response to a question is acceptable. \
+You are provided with a conversation between a User and an Agent. The Agent is playing the role of {name} and is representing {name} on their website. \
+Judge only whether the Agent's latest response sounds professional and engaging, as if talking to a potential client or future employer who came across the website. \
+Also set fact_check_needed to true only if the response states checkable specifics about {name} - dates, employers, job titles, \
+qualifications or numbers (years of experience, team sizes, results). General descriptions of their skills, interests or approach don't need a fact check."
+
+style_evaluator_system_message = {"role": "system", "content": style_evaluator_system_prompt}
+
+# Only the conversation, message and reply change per evaluation - they are filled into this template
+evaluator_user_template = (
+    "Here's the conversation between the User and the Agent: \n\n{history}\n\n"
+    "Here's the latest message from the User: \n\n{message}\n\n"
+    "Here's the latest response from the Agent: \n\n{reply}\n\n"
+    "Please evaluate the response, replying with whether it is acceptable and your feedback."
+)
+
+# The evaluator only needs the local context to judge the latest reply, so it gets
+# the last few turns instead of the whole conversation - its cost stays flat as chats grow
+evaluator_history_messages = 8  # 4 user + 4 assistant messages
+
 def evaluator_user_prompt(reply, message, history):
-    user_prompt = f"Here's the conversation between the User and the Agent: \n\n{history}\n\n"
-    user_prompt += f"Here's the latest message from the User: \n\n{message}\n\n"
-    user_prompt += f"Here's the latest response from the Agent: \n\n{reply}\n\n"
-    user_prompt += "Please evaluate the response, replying with whether it is acceptable and your feedback."
-    return user_prompt
+    recent = history[-evaluator_history_messages:]
+    return evaluator_user_template.format(history=recent, message=message, reply=reply)
 
 # =======================
-# Gemini Setup for Evaluation
+# Gemini Setup
 # =======================
-gemini = OpenAI(
+gemini = AsyncOpenAI(
     api_key=os.getenv("GOOGLE_API_KEY"), 
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    http_client=http_client,
+    max_retries=0
+)
+
+# =======================
+# Evaluator Client
+# =======================
+# The evaluator uses the same OpenAI client as the chat by default: same keep-alive
+# connections, same API key, and no cross-provider latency swings.
+# Set EVALUATOR_PROVIDER=gemini in your .env to evaluate with Gemini instead.
+if os.getenv("EVALUATOR_PROVIDER", "openai").lower() == "gemini":
+    evaluator_client, evaluator_model = gemini, "gemini-2.0-flash"
+else:
+    evaluator_client, evaluator_model = openai, "gpt-4o-mini"
+
+# =======================
+# Retry with Backoff and Fallback
+# =======================
+# Rate limits (429), dropped connections and 5xx errors are usually transient. Retry them a
+# few times with jittered exponential backoff, and if OpenAI still fails, answer with Gemini.
+# The clients are built with max_retries=0, so 3 attempts here really means 3 requests -
+# with the SDK's default of 2 retries underneath, it would be up to 9.
+transient_errors = (RateLimitError, APIConnectionError, InternalServerError)
+
+retry_transient = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_random_exponential(multiplier=0.3, max=4),
+    retry=retry_if_exception_type(transient_errors),
+    reraise=True
 )
 
+@retry_transient
+async def create_completion(client, model, messages, **kwargs):
+    return await client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+# The evaluator shares the same clients, so its structured-output calls get the same retries
+@retry_transient
+async def parse_completion(client, model, messages, **kwargs):
+    return await client.beta.chat.completions.parse(model=model, messages=messages, **kwargs)
+
+async def complete_with_fallback(messages, **kwargs):
+    try:
+        return await create_completion(openai, "gpt-4o-mini", messages, **kwargs)
+    except transient_errors as e:
+        print(f"OpenAI failed after retries ({e}) - falling back to Gemini")
+        # Gradio adds extra fields (metadata, options) to the history messages. OpenAI
+        # ignores them but Gemini rejects them, so only role and content are sent
+        messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+        return await create_completion(gemini, "gemini-2.0-flash", messages, **kwargs)
+
 # =======================
 # Evaluation Function
 # =======================
-def evaluate(reply, message, history) -> Evaluation:
-    messages = [{"role": "system", "content": evaluator_system_prompt}] + [{"role": "user", "content": evaluator_user_prompt(reply, message, history)}]
-    response = gemini.beta.chat.completions.parse(model="gemini-2.0-flash", messages=messages, response_format=Evaluation)
+async def evaluate(reply, message, history) -> Evaluation:
+    user_message = {"role": "user", "content": evaluator_user_prompt(reply, message, history)}
+    
+    # Tier 1: style only, without the profile
+    messages = [style_evaluator_system_message, user_message]
+    response = await parse_completion(evaluator_client, evaluator_model, messages, response_format=StyleEvaluation)
+    style = response.choices[0].message.parsed
+    if not style.is_acceptable:
+        return style
+    if not style.fact_check_needed:
+        return style
+    
+    # Tier 2: the reply states checkable specifics - check them against the full profile
+    messages = [evaluator_system_message, user_message]
+    response = await parse_completion(evaluator_client, evaluator_model, messages, response_format=Evaluation)
     return response.choices[0].message.parsed
 
+# =======================
+# Evaluation Pre-filter
+# =======================
+# Not every reply needs an evaluator round-trip to check it. Short greetings and thanks are
+# answered directly, and a reply we've already approved for the same message is fine again.
+# Only the most recently approved replies are remembered, so memory stays flat on a long-running server.
+greetings = {"hi", "hello", "hey", "thanks", "thank you", "thx", "bye", "good morning", "good evening"}
+approved_replies = OrderedDict()  # (hash(message), hash(reply)) pairs that passed evaluation, oldest first
+max_approved_replies = 256
+
+def needs_evaluation(reply, message):
+    if len(message) < 15 and message.lower().strip(".!? ") in greetings:
+        return False
+    key = (hash(message), hash(reply))
+    if key in approved_replies:
+        approved_replies.move_to_end(key)
+        return False
+    return True
+
+def remember_approved(reply, message):
+    key = (hash(message), hash(reply))
+    approved_replies[key] = True
+    approved_replies.move_to_end(key)
+    if len(approved_replies) > max_approved_replies:
+        approved_replies.popitem(last=False)  # Drop the least recently used
+
 # =======================
 # Rerun Function
 # =======================
-def rerun(reply, message, history, feedback):
-    updated_system_prompt = system_prompt + "\n\n## Previous answer rejected\nYou just tried to reply, but the quality control rejected your reply\n"
-    updated_system_prompt += f"## Your attempted answer:\n{reply}\n\n"
-    updated_system_prompt += f"## Reason for rejection:\n{feedback}\n\n"
-    messages = [{"role": "system", "content": updated_system_prompt}] + history + [{"role": "user", "content": message}]
-    response = openai.chat.completions.create(model="gpt-4o-mini", messages=messages)
+async def rerun(reply, message, history, feedback=None):
+    # feedback=None is the speculative retry started before the evaluation is back -
+    # nothing has been rejected yet, so it only asks for an alternative answer
+    # The extra instructions go in their own message so system_prompt stays cacheable
+    if feedback:
+        instructions = "## Previous answer rejected\nYou just tried to reply, but the quality control rejected your reply\n"
+        instructions += f"## Your attempted answer:\n{reply}\n\n"
+        instructions += f"## Reason for rejection:\n{feedback}\n\n"
+    else:
+        instructions = "## Alternative answer\nYou already drafted a reply to the latest message. Write a different, improved reply - "
+        instructions += "stay in character, and only state facts found in your summary and LinkedIn profile.\n"
+        instructions += f"## Your draft:\n{reply}\n\n"
+    messages = [system_message, {"role": "system", "content": instructions}, *history, {"role": "user", "content": message}]
+    response = await complete_with_fallback(messages)
     return response.choices[0].message.content
 
+# =======================
+# Template Replies
+# =======================
+# The opening questions ("tell me about yourself", "what do you do") are asked all the time
+# and deserve the same answer every time. Write those answers once in me/templates.yaml and
+# they are returned straight away, without calling any LLM. The file is optional:
+#
+# - pattern: "tell me about (you|yourself)"
+#   reply: "I'm Anjani, ..."
+# - pattern: "what do you do"
+#   reply: "..."
+#
+# Patterns are regular expressions, matched case-insensitively anywhere in the message.
+def load_templates(path="me/templates.yaml"):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        entries = yaml.safe_load(f) or []
+    return [(re.compile(entry["pattern"], re.IGNORECASE), entry["reply"]) for entry in entries]
+
+templates = load_templates()
+
+def template_reply(message):
+    for pattern, reply in templates:
+        if pattern.search(message):
+            return reply
+    return None
+
 # =======================
 # Chat Function with Evaluation and Retry
 # =======================
-def chat(message, history):
+chat_history_messages = 20  # Most history messages (10 turns) sent with each chat request
+
+async def chat(message, history):
     """
     Chat function that evaluates responses and retries if needed.
     
+    This is an async generator: the reply is streamed to Gradio as it is written,
+    so the user sees the first words straight away. Once the whole reply is in,
+    it is evaluated - and if it fails, the retry replaces it in the chat.
+    
+    The evaluation and a second draft are requested at the same time. If the
+    first reply passes, the second draft is cancelled; if it fails, the second
+    draft is already on its way instead of starting a new request. The second
+    draft is evaluated too, and if it also fails, a retry that is told why the
+    first reply was rejected is used instead.
+    
     Special note for people not using OpenAI:
     Some providers, like Groq, might give an error when you send your second message in the chat.
     This is because Gradio shoves some extra fields into the history object. OpenAI doesn't mind; but some other models complain.
@@ -130,28 +361,86 @@ def chat(message, history):
     # Clean up history for non-OpenAI providers if needed
     # history = [{"role": h["role"], "content": h["content"]} for h in history]
     
+    # The profile is already in the system prompt, so older turns add cost without much
+    # value - only the most recent ones are sent to the model
+    history = history[-chat_history_messages:]
+    
     # Special handling for patent questions (example)
-    if "patent" in message:
-        system = system_prompt + "\n\nEverything in your reply needs to be in pig latin - \
-              it is mandatory that you respond only and entirely in pig latin"
-    else:
-        system = system_prompt
+    pig_latin = bool(pig_latin_trigger_re.search(message))
+    
+    # Templated questions get their fixed answer - no OpenAI or evaluator calls at all
+    canned = None if pig_latin else template_reply(message)
+    if canned:
+        print("Template hit - returning template reply")
+        yield canned
+        return
     
-    messages = [{"role": "system", "content": system}] + history + [{"role": "user", "content": message}]
-    response = openai.chat.completions.create(model="gpt-4o-mini", messages=messages)
-    reply = response.choices[0].message.content
+    # Answer from the semantic cache when a similar question was answered before
+    # Patent questions get a special pig latin reply, so they are never cached
+    use_cache = response_cache_enabled and not pig_latin and not history
+    if use_cache:
+        cached = await asyncio.to_thread(cache_get, message)  # Embedding lookup is CPU work
+        if cached:
+            print("Cache hit - returning cached reply")
+            yield cached
+            return
+    
+    # The pig latin instruction is a separate message after the cached system_prompt
+    if pig_latin:
+        messages = [system_message, pig_latin_message, *history, {"role": "user", "content": message}]
+    else:
+        messages = [system_message, *history, {"role": "user", "content": message}]
+    stream = await complete_with_fallback(messages, stream=True)
+    reply = ""
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            reply += chunk.choices[0].delta.content
+            yield reply
 
-    # Evaluate the response
-    evaluation = evaluate(reply, message, history)
+    # Skip the evaluator for greetings and already-approved replies
+    if not needs_evaluation(reply, message):
+        print("Evaluation skipped - returning reply")
+        return
+
+    # Evaluate the response, and start a speculative retry alongside it
+    eval_task = asyncio.create_task(evaluate(reply, message, history))
+    retry_task = asyncio.create_task(rerun(reply, message, history))
+    
+    try:
+        evaluation = await eval_task
+    except BaseException:
+        retry_task.cancel()
+        raise
     
     if evaluation.is_acceptable:
         print("Passed evaluation - returning reply")
-    else:
-        print("Failed evaluation - retrying")
-        print(evaluation.feedback)
-        reply = rerun(reply, message, history, evaluation.feedback)
+        retry_task.cancel()
+        remember_approved(reply, message)
+        if use_cache:
+            await asyncio.to_thread(cache_put, message, reply)
+        return
+    
+    print("Failed evaluation - checking the second draft")
+    print(evaluation.feedback)
+    # Start the retry with the evaluator's feedback now, in case the second draft fails too
+    feedback_task = asyncio.create_task(rerun(reply, message, history, evaluation.feedback))
+    try:
+        draft = await retry_task
+        draft_evaluation = await evaluate(draft, message, history)
+    except BaseException:
+        feedback_task.cancel()
+        raise
     
-    return reply
+    if draft_evaluation.is_acceptable:
+        print("Second draft passed evaluation - using it")
+        feedback_task.cancel()
+        remember_approved(draft, message)
+        yield draft
+        if use_cache:
+            await asyncio.to_thread(cache_put, message, draft)
+    else:
+        print("Second draft failed evaluation - using the retry with feedback")
+        yield await feedback_task
 
 # =======================
 # Launch Gradio Interface